@@ -1,25 +1,78 @@
 import os, sys, time, json, argparse
 import random
-import requests
-import gspread
-from dotenv import load_dotenv
-from tenacity import retry, stop_after_attempt, wait_exponential_jitter
+import sched
+import threading
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from itertools import zip_longest
 from datetime import datetime, timedelta, time as dtime
+from typing import NamedTuple
 from zoneinfo import ZoneInfo
+try:
+    import orjson
+    def json_bytes(obj): return orjson.dumps(obj)
+except ImportError:  # orjson が無ければ標準の json で代用
+    def json_bytes(obj): return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+def json_str(obj): return json_bytes(obj).decode("utf-8")
 
 API_BASE = "https://graph.threads.net/v1.0"
 TZ = ZoneInfo("Asia/Tokyo")
+FLUSH_ROWS = 20  # run_batch でシートへまとめて書き込む行数
+MAX_WORKERS = 8  # Threads API への同時リクエスト数の上限
+CONTAINER_WAIT_SEC = 300  # 画像コンテナの処理完了を待つ上限（秒）
+ERROR_CELL_MAX = 3000  # error セルに残す最大文字数。超えたものは全文を ERROR_DIR にも書き出す
+ERROR_DIR = "errors"
+_POSTED = frozenset({"posted","Posted","POSTED"})  # status 列でよく使われる表記
+POST_COLS = ["text","image_url","alt_text","link_attachment","reply_control","topic_tag","location_id","status"]  # 投稿時に読む列
+# status / error は RAW で書く（"=" で始まるエラー文を数式にしない）。posted_at は日時として残すため USER_ENTERED
+_INPUT_OPTION = {"posted_at": "USER_ENTERED"}
 NEED_COLS = ["text","image_url","alt_text","link_attachment","reply_control","topic_tag","location_id","status","posted_at","error"]
 
+# requests / gspread / dotenv は使う関数の中で import する（cron 起動時の import を軽くする）
+
+_SESSION=None
+_SESSION_LOCK=threading.Lock()
+
+def _session():
+    # graph.threads.net への接続は使い回す（投稿ごとの TLS ハンドシェイクを避ける）
+    global _SESSION
+    with _SESSION_LOCK:
+        if _SESSION is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            _SESSION=requests.Session()
+            # run_batch ではワーカー MAX_WORKERS 本に加えてメインスレッドも TEXT を作成するので +1
+            _SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=MAX_WORKERS+1, max_retries=0))
+            _SESSION.headers.update({"User-Agent": "threads_auto_post_gs"})
+        return _SESSION
+
+class ThreadsAPIError(Exception):
+    def __init__(self, resp):
+        super().__init__(f"HTTP {resp.status_code}: {resp.text}")
+        self.status_code=resp.status_code
+
 def auth_headers(token):
     return {"Authorization": f"Bearer {token}"}
 
+class Env(NamedTuple):
+    user_id: str
+    token: str
+    sheet_url: str
+    sheet_tab: str
+
+@functools.lru_cache(maxsize=1)
 def _service_account_path():
-    return (os.environ.get("GSPREAD_SERVICE_ACCOUNT_FILE")
-            or os.environ.get("GOOGLE_APPLICATION_CREDENTIALS")
-            or os.path.expanduser("~/.config/gspread/service_account.json"))
+    # 鍵ファイルが無ければ None（gspread の既定の探索に任せる）。プロセス中1回だけ調べる
+    sa=(os.environ.get("GSPREAD_SERVICE_ACCOUNT_FILE")
+        or os.environ.get("GOOGLE_APPLICATION_CREDENTIALS")
+        or os.path.expanduser("~/.config/gspread/service_account.json"))
+    return sa if os.path.exists(sa) else None
 
+@functools.lru_cache(maxsize=1)
 def load_env():
+    from dotenv import load_dotenv
     load_dotenv()
     user_id=os.getenv("THREADS_USER_ID","").strip()
     token=os.getenv("THREADS_ACCESS_TOKEN","").strip()
@@ -29,51 +82,96 @@ def load_env():
         print("THREADS_USER_ID or THREADS_ACCESS_TOKEN missing in .env", file=sys.stderr); sys.exit(2)
     if not sheet_url:
         print("SHEET_URL missing in .env", file=sys.stderr); sys.exit(2)
-    return user_id, token, sheet_url, sheet_tab
+    return Env(user_id, token, sheet_url, sheet_tab)
 
 def gs_open(sheet_url, sheet_tab):
+    import gspread
     sa=_service_account_path()
-    gc=gspread.service_account(filename=sa) if os.path.exists(sa) else gspread.service_account()
+    gc=gspread.service_account(filename=sa) if sa else gspread.service_account()
     sh=gc.open_by_url(sheet_url)
     ws=sh.worksheet(sheet_tab) if sheet_tab else sh.sheet1
     return ws
 
 def ensure_header(ws):
-    values=ws.get_all_values()
-    if not values:
-        ws.update(values=[NEED_COLS], range_name="1:1"); return NEED_COLS
-    header=values[0]; changed=False
+    from gspread.utils import rowcol_to_a1
+    # 1行目だけを読む（全体は読まない）
+    header=ws.row_values(1) or []
+    if not header:
+        ws.update(values=[NEED_COLS], range_name="A1"); return list(NEED_COLS)
+    changed=False
     for col in NEED_COLS:
         if col not in header:
             header.append(col); changed=True
     if changed:
-        ws.update(values=[header], range_name="1:1")
+        ws.update(values=[header], range_name=f"A1:{rowcol_to_a1(1, len(header))}")
     return header
 
-def rows_with_index(ws, header):
-    values=ws.get_all_values()
-    if len(values)<=1: return []
-    rows=[]
-    for i, raw in enumerate(values[1:], start=2):  # sheet row index
-        row={h:(raw[idx] if idx<len(raw) else "") for idx,h in enumerate(header)}
-        rows.append((i,row))
-    return rows
+@dataclass(slots=True)
+class Row:
+    # 行選択に要る列だけを持つ軽量な行。全列の dict は投稿する行だけ as_dict() で作る
+    idx: int   # シート上の行番号
+    status: str
+    text: str
+    image_url: str
+    raw: tuple
+    keys: list  # raw の各要素に対応する列名
+
+    def as_dict(self):
+        return row_dict(self.keys, self.raw)
+
+def row_dict(keys, raw):
+    return {h:(raw[k] if k<len(raw) else "") for k,h in enumerate(keys)}
+
+def rows_with_index(ws, cols, names=POST_COLS):
+    # names の列だけを1回の values.batchGet で読む（既定は投稿に使う列。posted_at / error は読まない）
+    columns=read_columns(ws, cols, names)
+    si, ti, ii = names.index("status"), names.index("text"), names.index("image_url")
+    for i, raw in enumerate(zip_longest(*columns, fillvalue=""), start=2):  # sheet row index
+        yield Row(i, raw[si], raw[ti], raw[ii], raw, names)
+
+def read_columns(ws, cols, names):
+    # 指定列の2行目以降を1回の values.batchGet で列ごとに読む（末尾の空セルは返らない）
+    res=ws.batch_get([f"{cols[h]}2:{cols[h]}" for h in names], major_dimension="COLUMNS")
+    return [vr[0] if vr else [] for vr in res]
+
+def find_first_unposted_idx(ws, cols):
+    # status / text / image_url の3列だけで最初の未投稿行を探し、シート上の行番号を返す
+    pick=first_unposted(rows_with_index(ws, cols, ["status","text","image_url"]))
+    return pick.idx if pick else None
+
+def _request_with_retry(method, url, attempts=3, **kw):
+    # 5xx / 429 / 通信エラーだけを再試行する。最後の応答（4xx を含む）はそのまま返す
+    import requests
+    session=_session()
+    for k in range(attempts):
+        last = k==attempts-1
+        try:
+            resp=session.request(method, url, timeout=30, **kw)
+        except requests.RequestException:
+            if last: raise
+        else:
+            if last or (resp.status_code<500 and resp.status_code!=429): return resp
+        time.sleep(min(4, 2**k) + random.random())
 
-@retry(stop=stop_after_attempt(3), wait=wait_exponential_jitter(1, 4), reraise=True)
 def create_container(user_id, token, payload):
     url=f"{API_BASE}/{user_id}/threads"
-    resp=requests.post(url, headers=auth_headers(token), json=payload, timeout=30)
-    if resp.status_code>=400: raise Exception(f"HTTP {resp.status_code}: {resp.text}")
+    resp=_request_with_retry("POST", url, headers={**auth_headers(token), "Content-Type": "application/json"}, data=json_bytes(payload))
+    if resp.status_code>=400: raise ThreadsAPIError(resp)
     return resp.json()
 
-@retry(stop=stop_after_attempt(3), wait=wait_exponential_jitter(1, 4), reraise=True)
 def publish_container(user_id, token, creation_id):
     url=f"{API_BASE}/{user_id}/threads_publish"
-    resp=requests.post(url, headers=auth_headers(token), params={"creation_id": creation_id}, timeout=30)
-    if resp.status_code>=400: raise Exception(f"HTTP {resp.status_code}: {resp.text}")
+    resp=_request_with_retry("POST", url, headers=auth_headers(token), params={"creation_id": creation_id})
+    if resp.status_code>=400: raise ThreadsAPIError(resp)
     return resp.json()
 
-def post_one(user_id, token, row):
+def get_container_status(token, creation_id):
+    url=f"{API_BASE}/{creation_id}"
+    resp=_request_with_retry("GET", url, headers=auth_headers(token), params={"fields": "status,error_message"})
+    if resp.status_code>=400: raise ThreadsAPIError(resp)
+    return resp.json()
+
+def build_payload(row):
     text = (row.get("text") or "").strip()
     image_url = (row.get("image_url") or "").strip()
     if image_url:
@@ -82,85 +180,205 @@ def post_one(user_id, token, row):
         if row.get("reply_control"):  payload["reply_control"]=row["reply_control"]
         if row.get("topic_tag"):      payload["topic_tag"]=row["topic_tag"]
         if row.get("location_id"):    payload["location_id"]=row["location_id"]
-        data=create_container(user_id, token, payload)
-        cid=data.get("id")
-        pub=publish_container(user_id, token, cid)
-        return {"status":"published","container_id":cid,"media_type":"IMAGE","publish":pub}
     else:
         payload={"media_type":"TEXT","text":text,"auto_publish_text":True}
         if row.get("link_attachment"): payload["link_attachment"]=row["link_attachment"]
         if row.get("reply_control"):   payload["reply_control"]=row["reply_control"]
         if row.get("topic_tag"):       payload["topic_tag"]=row["topic_tag"]
         if row.get("location_id"):     payload["location_id"]=row["location_id"]
-        data=create_container(user_id, token, payload)
-        return {"status":"published","container_id":data.get("id"),"media_type":"TEXT"}
+    return payload
+
+def post_one(user_id, token, row):
+    payload=build_payload(row)
+    data=create_container(user_id, token, payload)
+    cid=data.get("id")
+    if payload["media_type"]=="IMAGE":
+        pub=publish_container(user_id, token, cid)
+        return {"status":"published","container_id":cid,"media_type":"IMAGE","publish":pub}
+    return {"status":"published","container_id":cid,"media_type":"TEXT"}
 
-def update_result(ws, header, row_idx, status, err=""):
-    col_idx = {h:i+1 for i,h in enumerate(header)}
-    ts=time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
-    ws.update_cell(row_idx, col_idx["status"], status)
-    ws.update_cell(row_idx, col_idx["posted_at"], ts if status=="posted" else "")
-    ws.update_cell(row_idx, col_idx["error"], err[:3000] if status=="failed" else "")
+def header_cols(header):
+    # 列名 -> 列記号（"A", "B", ...）。ヘッダ確定後に1回だけ作る
+    from gspread.utils import rowcol_to_a1
+    return {h: rowcol_to_a1(1, i+1)[:-1] for i,h in enumerate(header)}
+
+def result_updates(cols, row_idx, status, err=""):
+    # status / posted_at / error の3セル分の batch_update 用データ（投稿直後に呼ぶ）
+    ts=datetime.now(TZ).strftime("%Y-%m-%d %H:%M:%S") if status=="posted" else ""
+    cells={"status":status, "posted_at":ts, "error":error_cell(row_idx, err) if status=="failed" else ""}
+    return [{"range":f"{cols[c]}{row_idx}", "values":[[v]], "input":_INPUT_OPTION.get(c, "RAW")} for c,v in cells.items()]
+
+def error_text(e):
+    # 例外をログ用の全文にする（セル用の短縮は error_cell で行う）
+    return f"{type(e).__name__}: {e}"
+
+def error_cell(row_idx, err):
+    # error セル用の文字列。長すぎるものは先頭 ERROR_CELL_MAX 文字をセルに残し、全文はファイルにも書く
+    # （GitHub Actions ではジョブ終了でファイルが消えるので、セルだけで読めるようにしておく）
+    if len(err)<=ERROR_CELL_MAX: return err
+    os.makedirs(ERROR_DIR, exist_ok=True)
+    path=os.path.join(ERROR_DIR, f"{row_idx}_{datetime.now(TZ).strftime('%Y%m%d%H%M%S')}.log")
+    with open(path, "w", encoding="utf-8") as f: f.write(err)
+    return f"{err[:ERROR_CELL_MAX]} ... (full error: {path})"
+
+def write_updates(ws, updates):
+    # result_updates() の結果を value_input_option ごとに batch_update で書く（多くても2回）
+    # gspread は渡した dict の range を書き換えるので、失敗時に再送できるよう毎回新しい dict を渡す
+    for opt in ("RAW", "USER_ENTERED"):
+        data=[{"range":u["range"], "values":u["values"]} for u in updates if u["input"]==opt]
+        if data: ws.batch_update(data, value_input_option=opt)
+
+def update_result(ws, cols, row_idx, status, err=""):
+    write_updates(ws, result_updates(cols, row_idx, status, err))
+
+def flush_updates(ws, updates):
+    if updates:
+        write_updates(ws, updates)
+        updates.clear()
 
 def first_unposted(rows):
-    for (i,r) in rows:
-        if (r.get("status","").strip().lower()!="posted" and (r.get("text") or r.get("image_url"))):
-            return (i,r)
+    for r in rows:
+        # 大半の行は _POSTED との照合だけで弾く。strip/lower は候補行にだけ行う
+        if r.status not in _POSTED and (r.text or r.image_url) and r.status.strip().lower()!="posted":
+            return r
     return None
 
 def post_next_unposted(user_id, token, ws, header):
-    rows=rows_with_index(ws, header)
-    pick=first_unposted(rows)
-    if not pick:
-        print(json.dumps({"ok":True,"msg":"no rows to post"}, ensure_ascii=False))
+    cols=header_cols(header)
+    # 1件だけ投稿するのでシート全体は読まず、必要な列と対象行だけを取る
+    row_idx=find_first_unposted_idx(ws, cols)
+    if not row_idx:
+        print(json_str({"ok":True,"msg":"no rows to post"}))
         return False
-    row_idx, row = pick
+    row=row_dict(header, ws.row_values(row_idx))
+    # try で囲むのは API 呼び出しだけ。シート書き込みの失敗を行の失敗として記録しない
     try:
         res=post_one(user_id, token, row)
-        update_result(ws, header, row_idx, "posted", "")
-        print(json.dumps({"ok":True,"row_idx":row_idx,"row":row,"res":res}, ensure_ascii=False))
-        return True
     except Exception as e:
-        err=str(e)
-        update_result(ws, header, row_idx, "failed", err)
-        print(json.dumps({"ok":False,"row_idx":row_idx,"row":row,"err":err}, ensure_ascii=False))
+        err=error_text(e)
+        update_result(ws, cols, row_idx, "failed", err)
+        print(json_str({"ok":False,"row_idx":row_idx,"row":row,"err":err}))
         return False
+    update_result(ws, cols, row_idx, "posted", "")
+    print(json_str({"ok":True,"row_idx":row_idx,"row":row,"res":res}))
+    return True
 
 # --------- モード実装 ---------
 
+def _report(cols, row_idx, row, res=None, err=None):
+    # 結果をログに出し、シートへ書くべき更新を返す
+    if err is None:
+        print(json_str({"ok":True,"row_idx":row_idx,"row":row,"res":res}))
+        return result_updates(cols, row_idx, "posted", "")
+    print(json_str({"ok":False,"row_idx":row_idx,"row":row,"err":err}))
+    return result_updates(cols, row_idx, "failed", err)
+
+def _poll_status(token, cid):
+    # 通信エラー / 5xx / 429 は未完了扱いにして次のラウンドで再確認。それ以外（4xx など）はその行を失敗にする
+    import requests
+    try: return get_container_status(token, cid)
+    except Exception as e:
+        transient=(isinstance(e, requests.RequestException)
+                   or (isinstance(e, ThreadsAPIError) and (e.status_code>=500 or e.status_code==429)))
+        return {"status":"" if transient else "ERROR", "error_message":error_text(e)}
+
 def run_batch(max_per_run=0):
     user_id, token, sheet_url, sheet_tab=load_env()
     ws=gs_open(sheet_url, sheet_tab)
     header=ensure_header(ws)
-    rows=rows_with_index(ws, header)
-    n=0
-    while True:
+    cols=header_cols(header)
+    # シートは1回だけ読み、投稿対象を先にまとめて選ぶ（rows はジェネレータ）
+    rows=rows_with_index(ws, cols)
+    picks=[]
+    while not max_per_run or len(picks)<max_per_run:
         pick=first_unposted(rows)
         if not pick: break
-        row_idx, row = pick
-        try:
-            res=post_one(user_id, token, row)
-            update_result(ws, header, row_idx, "posted", "")
-            print(json.dumps({"ok":True,"row_idx":row_idx,"row":row,"res":res}, ensure_ascii=False))
-        except Exception as e:
-            update_result(ws, header, row_idx, "failed", str(e))
-            print(json.dumps({"ok":False,"row_idx":row_idx,"row":row,"err":str(e)}, ensure_ascii=False))
-        n+=1
-        if max_per_run and n>=max_per_run: break
-        # 次の先頭を見に行く
-        rows=rows_with_index(ws, header)
+        picks.append((pick.idx, pick.as_dict()))
+    # シートへの書き込みは貯めておき、FLUSH_ROWS 行ごとと最後にまとめて送る
+    updates=[]
+    def flush(full_only=False):
+        if not full_only or len(updates)>=FLUSH_ROWS*3: flush_updates(ws, updates)
+    def report(row_idx, row, res=None, err=None, defer=False):
+        # defer=True は記録だけして送らない（呼び出し側が後で flush(full_only=True) する）
+        updates.extend(_report(cols, row_idx, row, res, err))
+        if not defer: flush(full_only=True)
+    try:
+        _run_phases(user_id, token, picks, report, flush)
+    finally:
+        flush_updates(ws, updates)
+
+def _run_phases(user_id, token, picks, report, flush):
+    # 1) コンテナ作成。TEXT は auto_publish_text で作成と同時に公開されるので、
+    #    シートの順に1件ずつ作る。IMAGE のコンテナ作成だけを並列に発行する
+    #    （IMAGE は処理完了を待ってから公開するため、後ろの TEXT より後に出ることがある。IMAGE 同士はシートの順）
+    pending=[]
+    if picks:
+        with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(picks))) as ex:
+            jobs=[]
+            for row_idx, row in picks:
+                payload=build_payload(row)
+                fut=ex.submit(create_container, user_id, token, payload) if payload["media_type"]=="IMAGE" else None
+                jobs.append((row_idx, row, payload, fut))
+            for row_idx, row, payload, fut in jobs:
+                # try で囲むのは API 呼び出しだけ。シート書き込みの失敗を行の失敗として記録しない
+                try:
+                    data=create_container(user_id, token, payload) if fut is None else fut.result()
+                except Exception as e:
+                    report(row_idx, row, err=error_text(e))
+                    continue
+                cid=data.get("id")
+                if fut is None:
+                    report(row_idx, row, res={"status":"published","container_id":cid,"media_type":"TEXT"})
+                elif not cid:
+                    report(row_idx, row, err=f"no container id in response: {json_str(data)}")
+                else:
+                    pending.append((row_idx, row, cid))
+    # TEXT はもう公開済みなので、画像の待ち時間に入る前にシートへ記録しておく
+    flush()
+    # 2) 画像コンテナの処理状況をまとめてポーリングし、FINISHED になったものをシートの順に1件ずつ公開
+    #    （前の行がまだ処理中なら、後ろの行は FINISHED でもその行が片付くまで待たせる）
+    delay=1; deadline=time.monotonic()+CONTAINER_WAIT_SEC
+    with ThreadPoolExecutor(max_workers=4) as ex:
+        while pending:
+            time.sleep(delay); delay=min(delay*2, 30)
+            states=list(ex.map(lambda p: _poll_status(token, p[2]), pending))
+            ready=[]; waiting=[]
+            for (row_idx, row, cid), st in zip(pending, states):
+                status=st.get("status")
+                if status=="FINISHED" and not waiting:
+                    ready.append((row_idx, row, cid))
+                elif status=="FINISHED":
+                    waiting.append((row_idx, row, cid))
+                elif status in ("ERROR","EXPIRED"):
+                    report(row_idx, row, err=f"container {status}: {st.get('error_message','')}", defer=True)
+                elif time.monotonic()>=deadline:
+                    report(row_idx, row, err=f"container not ready after {CONTAINER_WAIT_SEC}s: {status} {st.get('error_message','')}".strip(), defer=True)
+                else:
+                    waiting.append((row_idx, row, cid))
+            # 公開結果を全部記録してから送る。途中で書き込みが失敗しても、公開済みの行は最後の flush で記録される
+            for row_idx, row, cid in ready:
+                try:
+                    pub=publish_container(user_id, token, cid)
+                except Exception as e:
+                    report(row_idx, row, err=error_text(e), defer=True)
+                else:
+                    report(row_idx, row, res={"status":"published","container_id":cid,"media_type":"IMAGE","publish":pub}, defer=True)
+            flush(full_only=True)
+            pending=waiting
 
 def run_schedule(interval_min=120):
-    import schedule
     user_id, token, sheet_url, sheet_tab=load_env()
     ws=gs_open(sheet_url, sheet_tab)
     header=ensure_header(ws)
     def job():
         post_next_unposted(user_id, token, ws, header)
-    job()
-    schedule.every(interval_min).minutes.do(job)
+    interval=interval_min*60
+    next_run=time.monotonic()
     while True:
-        schedule.run_pending(); time.sleep(1)
+        time.sleep(max(0, next_run - time.monotonic()))
+        job()
+        # 実行が長引いて周期を過ぎていたら、溜まった分は捨ててすぐ次を実行
+        next_run=max(next_run + interval, time.monotonic())
 
 # --- 時刻ユーティリティ ---
 
@@ -169,10 +387,14 @@ def _parse_hhmm(s):
     return dtime(hour=h, minute=m)
 
 def _parse_hhmm_ext(s):
-    # 24:00 や 26:00 を翌日に解釈
+    # 24:00 や 26:00 も受け付ける。毎日実行なので 26:00 は 02:00 と同じ時刻として返す
     h,m = map(int, s.split(":"))
-    extra_days, h = divmod(h, 24)
-    return extra_days, dtime(hour=h, minute=m)
+    return dtime(hour=h % 24, minute=m)
+
+def _sleep_until(at):
+    # 目標時刻まで1回で眠る（早く起きた場合だけ残りを寝直す）
+    while (secs := (at - datetime.now(TZ)).total_seconds()) > 0:
+        time.sleep(secs)
 
 def _next_random_in_window(window_str):
     # "HH:MM-HH:MM" のウィンドウ内で次のランダム実行時刻（JST）
@@ -196,48 +418,52 @@ def _next_random_in_window(window_str):
 def run_daily_window(window_str):
     user_id, token, sheet_url, sheet_tab=load_env()
     print(f"[scheduler] daily window = {window_str}")
+    # シートを開くのは起動時の1回だけ。ヘッダは各回1行だけ読んで確認する
+    ws=gs_open(sheet_url, sheet_tab)
     while True:
         nxt = _next_random_in_window(window_str)
         print(f"[scheduler] next run at {nxt.isoformat()}")
-        while True:
-            now = datetime.now(TZ)
-            if now >= nxt: break
-            time.sleep(min(60, max(1,int((nxt-now).total_seconds()))))
-        ws=gs_open(sheet_url, sheet_tab)
+        _sleep_until(nxt)
         header=ensure_header(ws)
         post_next_unposted(user_id, token, ws, header)
         # 次は翌日のウィンドウを抽選
         nxt = _next_random_in_window(window_str)
         nxt = nxt + timedelta(days=1)
 
-def _next_at_with_jitter(time_str, jitter_min, ref=None):
+def _next_at_with_jitter(t, jitter_min, ref=None):
+    # t は _parse_hhmm_ext() の結果の dtime。ref 以降で最初の枠から実行時刻を抽選し、
+    # (実行時刻, 枠の終わり) を返す。次の枠は「枠の終わり」を ref にして求める（実行時刻からだと日ごとにずれる）
     if ref is None: ref = datetime.now(TZ)
-    d, t = _parse_hhmm_ext(time_str)
-    base = datetime.combine(ref.date(), t, TZ) + timedelta(days=d)
+    base = datetime.combine(ref.date(), t, TZ)
     start = base - timedelta(minutes=jitter_min)
     end   = base + timedelta(minutes=jitter_min)
-    if ref > end:
+    if ref >= end:
         base += timedelta(days=1); start = base - timedelta(minutes=jitter_min); end = base + timedelta(minutes=jitter_min)
     start = max(start, ref + timedelta(seconds=5))
     secs = max(60, int((end - start).total_seconds()))
     offs = random.randint(0, secs)
-    return start + timedelta(seconds=offs)
+    return start + timedelta(seconds=offs), end
+
+def _next_slot(t, jitter_min, end):
+    # 実行した枠の次の枠。枠の終わりから求めるが、1日以上遅れて起きた場合は今から求める（逃した日の分をまとめて実行しない）
+    return _next_at_with_jitter(t, jitter_min, ref=max(end, datetime.now(TZ)))
 
 def run_daily_at(time_str, jitter_min):
     user_id, token, sheet_url, sheet_tab=load_env()
     print(f"[scheduler] daily at {time_str} ±{jitter_min}min")
-    while True:
-        nxt = _next_at_with_jitter(time_str, jitter_min)
-        print(f"[scheduler] next run at {nxt.isoformat()}")
-        while True:
-            now = datetime.now(TZ)
-            if now >= nxt: break
-            time.sleep(min(60, max(1,int((nxt-now).total_seconds()))))
-        ws=gs_open(sheet_url, sheet_tab)
+    parsed = _parse_hhmm_ext(time_str)
+    ws=gs_open(sheet_url, sheet_tab)
+    s = sched.scheduler(time.time, time.sleep)
+    def job(end):
         header=ensure_header(ws)
         post_next_unposted(user_id, token, ws, header)
         # 実行した枠は翌日へ
-        nxt = _next_at_with_jitter(time_str, jitter_min, ref=nxt + timedelta(days=1))
+        arm(*_next_slot(parsed, jitter_min, end))
+    def arm(at, end):
+        print(f"[scheduler] next run at {at.isoformat()}")
+        s.enterabs(at.timestamp(), 1, job, (end,))
+    arm(*_next_at_with_jitter(parsed, jitter_min))
+    s.run()
 
 def run_daily_multi_at(times_csv, jitter_min):
     user_id, token, sheet_url, sheet_tab=load_env()
@@ -245,27 +471,28 @@ def run_daily_multi_at(times_csv, jitter_min):
     if not times:
         print("Please set --times as comma-separated HH:MM (JST)", file=sys.stderr); sys.exit(2)
     print(f"[scheduler] daily multi at {times} ±{jitter_min}min")
-    # 初期スケジュール
-    schedule_map = {t: _next_at_with_jitter(t, jitter_min) for t in times}
-    while True:
-        # 最も近い予定を実行
-        next_t, next_at = min(schedule_map.items(), key=lambda kv: kv[1])
-        print(f"[scheduler] next run [{next_t}] at {next_at.isoformat()}")
-        while True:
-            now = datetime.now(TZ)
-            if now >= next_at: break
-            time.sleep(min(60, max(1,int((next_at-now).total_seconds()))))
-        ws=gs_open(sheet_url, sheet_tab)
+    # 時刻文字列の解析は起動時に1回だけ
+    parsed = {t: _parse_hhmm_ext(t) for t in times}
+    ws=gs_open(sheet_url, sheet_tab)
+    # 全時刻を1つのスケジューラに登録し、実行した枠だけ翌日分を登録し直す
+    s = sched.scheduler(time.time, time.sleep)
+    def job(t, end):
         header=ensure_header(ws)
         post_next_unposted(user_id, token, ws, header)
-        # 実行済みの時刻は翌日分を再計算
-        schedule_map[next_t] = _next_at_with_jitter(next_t, jitter_min, ref=next_at + timedelta(days=1))
+        arm(t, *_next_slot(parsed[t], jitter_min, end))
+    def arm(t, at, end):
+        print(f"[scheduler] next run [{t}] at {at.isoformat()}")
+        s.enterabs(at.timestamp(), 1, job, (t, end))
+    for t in parsed:
+        arm(t, *_next_at_with_jitter(parsed[t], jitter_min))
+    s.run()
 
 def main():
     p=argparse.ArgumentParser()
     p.add_argument("--mode", choices=["batch","schedule","daily_window","daily_at","daily_multi_at"], default="batch")
     p.add_argument("--interval-min", type=int, default=120)
-    p.add_argument("--max-per-run", type=int, default=0)
+    p.add_argument("--max-per-run", type=int, default=0,
+                   help="batch: rows to post per run (0 = all). TEXT rows go out in sheet order; IMAGE rows are published once their media finishes processing, so they may follow later TEXT rows but keep sheet order among themselves")
     p.add_argument("--window", help="HH:MM-HH:MM (JST)", default=None)
     p.add_argument("--time", help="HH:MM (JST)", default=None)
     p.add_argument("--times", help="Comma-separated HH:MM list (JST)", default=None)
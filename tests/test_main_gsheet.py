@@ -0,0 +1,184 @@
+import os, sys, unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import main_gsheet as m
+
+class NextAtWithJitterTest(unittest.TestCase):
+    def _runs(self, time_str, ref, days, jitter_min=30):
+        parsed = m._parse_hhmm_ext(time_str)
+        runs = []
+        at, end = m._next_at_with_jitter(parsed, jitter_min, ref=ref)
+        for _ in range(days):
+            runs.append(at)
+            at, end = m._next_at_with_jitter(parsed, jitter_min, ref=end)
+        return runs
+
+    def _assert_daily(self, runs, first_base, jitter_min=30):
+        for k, at in enumerate(runs):
+            base = first_base + timedelta(days=k)
+            self.assertLessEqual(abs(at - base), timedelta(minutes=jitter_min), at)
+
+    def test_daily_slot_does_not_drift_or_skip(self):
+        ref = datetime(2026, 10, 15, 12, 0, tzinfo=m.TZ)
+        runs = self._runs("18:00", ref, 30)
+        self._assert_daily(runs, datetime(2026, 10, 15, 18, 0, tzinfo=m.TZ))
+
+    def test_slot_past_midnight_runs_every_day(self):
+        ref = datetime(2026, 10, 15, 12, 0, tzinfo=m.TZ)
+        runs = self._runs("26:00", ref, 30)
+        self._assert_daily(runs, datetime(2026, 10, 16, 2, 0, tzinfo=m.TZ))
+
+    def test_slot_past_midnight_is_not_skipped_tonight(self):
+        ref = datetime(2026, 10, 16, 1, 0, tzinfo=m.TZ)
+        runs = self._runs("26:00", ref, 3)
+        self._assert_daily(runs, datetime(2026, 10, 16, 2, 0, tzinfo=m.TZ))
+
+    def test_late_fire_does_not_replay_missed_days(self):
+        now = datetime(2026, 10, 18, 19, 0, tzinfo=m.TZ)
+        class FixedDatetime(datetime):
+            @classmethod
+            def now(cls, tz=None): return now
+        parsed = m._parse_hhmm_ext("18:00")
+        end = datetime(2026, 10, 15, 18, 30, tzinfo=m.TZ)
+        with mock.patch.object(m, "datetime", FixedDatetime):
+            at, end = m._next_slot(parsed, 30, end)
+        self.assertGreater(at, now)
+        self._assert_daily([at], datetime(2026, 10, 19, 18, 0, tzinfo=m.TZ))
+
+class FakeWorksheet:
+    # gspread.Worksheet のうち run_batch が使う部分だけ。batch_update は本物と同じく range を書き換える
+    title = "Sheet1"
+
+    def __init__(self, rows, fail_writes=0):
+        self.values = [list(m.NEED_COLS)] + rows
+        self.fail_writes = fail_writes
+        self.writes = []
+        self.cells = {}  # 書き込めたセル（range -> 値）
+        self.input = {}  # range -> value_input_option
+
+    def row_values(self, i):
+        return list(self.values[i-1]) if i <= len(self.values) else []
+
+    def batch_get(self, ranges, major_dimension=None):
+        out = []
+        for r in ranges:
+            col = ord(r[0]) - ord("A")
+            vals = [row[col] if col < len(row) else "" for row in self.values[1:]]
+            while vals and vals[-1] == "": vals.pop()
+            out.append([vals] if vals else [])
+        return out
+
+    def batch_update(self, data, value_input_option=None):
+        for u in data:
+            if "!" in u["range"]: raise Exception(f"400 invalid range {u['range']}")
+            u["range"] = f"'{self.title}'!{u['range']}"
+        if self.fail_writes:
+            self.fail_writes -= 1
+            raise Exception("503 backend error")
+        written = {u["range"]: u["values"][0][0] for u in data}
+        self.writes.append(written)
+        self.cells.update(written)
+        self.input.update(dict.fromkeys(written, value_input_option))
+
+def run_batch(ws, flush_rows=20, created=None, status=None):
+    if created is None: created = {"id": "c1"}
+    with mock.patch.object(m, "load_env", return_value=("u", "t", "url", "")), \
+         mock.patch.object(m, "gs_open", return_value=ws), \
+         mock.patch.object(m, "create_container", **({"side_effect": created} if callable(created) else {"return_value": created})), \
+         mock.patch.object(m, "get_container_status", side_effect=status) as get_status, \
+         mock.patch.object(m, "FLUSH_ROWS", flush_rows), \
+         mock.patch.object(m.time, "sleep"), \
+         mock.patch("builtins.print"):
+        m.run_batch()
+    return get_status
+
+class RunBatchFlushTest(unittest.TestCase):
+    def test_final_flush_resends_after_failed_flush(self):
+        ws = FakeWorksheet([["hello"]], fail_writes=1)
+        with self.assertRaisesRegex(Exception, "503"):
+            run_batch(ws)
+        self.assertEqual(len(ws.writes), 2)
+        self.assertEqual(ws.cells["'Sheet1'!H2"], "posted")
+
+    def test_failed_flush_is_not_recorded_as_failed_post(self):
+        ws = FakeWorksheet([["hello"]], fail_writes=1)
+        with self.assertRaisesRegex(Exception, "503"):
+            run_batch(ws, flush_rows=1)
+        self.assertEqual(len(ws.writes), 2)
+        self.assertEqual(ws.cells["'Sheet1'!H2"], "posted")
+        self.assertEqual(ws.cells["'Sheet1'!J2"], "")
+
+    def test_failed_flush_keeps_every_published_image(self):
+        ws = FakeWorksheet([["", "http://img1"], ["", "http://img2"]], fail_writes=1)
+        with mock.patch.object(m, "publish_container", return_value={"id": "p1"}) as publish:
+            with self.assertRaisesRegex(Exception, "503"):
+                run_batch(ws, flush_rows=1, status=lambda token, cid: {"status": "FINISHED"})
+        self.assertEqual(publish.call_count, 2)
+        self.assertEqual(len(ws.writes), 2)
+        self.assertEqual(ws.cells["'Sheet1'!H2"], "posted")
+        self.assertEqual(ws.cells["'Sheet1'!H3"], "posted")
+
+    def test_posted_at_is_written_as_date_time(self):
+        ws = FakeWorksheet([["hello"]])
+        run_batch(ws)
+        self.assertEqual(ws.input["'Sheet1'!H2"], "RAW")
+        self.assertEqual(ws.input["'Sheet1'!J2"], "RAW")
+        self.assertEqual(ws.input["'Sheet1'!I2"], "USER_ENTERED")
+        datetime.strptime(ws.cells["'Sheet1'!I2"], "%Y-%m-%d %H:%M:%S")
+
+class PostNextUnpostedTest(unittest.TestCase):
+    def test_failed_status_write_is_not_recorded_as_failed_post(self):
+        ws = FakeWorksheet([["hello"]], fail_writes=1)
+        with mock.patch.object(m, "post_one", return_value={"status": "published"}) as post_one, \
+             mock.patch("builtins.print"):
+            with self.assertRaisesRegex(Exception, "503"):
+                m.post_next_unposted("u", "t", ws, list(m.NEED_COLS))
+        post_one.assert_called_once()
+        self.assertEqual(ws.cells, {})
+
+class FakeResponse:
+    def __init__(self, status_code, text=""):
+        self.status_code = status_code
+        self.text = text
+
+class RunBatchImageTest(unittest.TestCase):
+    def test_missing_container_id_fails_without_polling(self):
+        ws = FakeWorksheet([["", "http://img"]])
+        get_status = run_batch(ws, created={})
+        get_status.assert_not_called()
+        self.assertEqual(ws.cells["'Sheet1'!H2"], "failed")
+
+    def test_client_error_while_polling_fails_row_at_once(self):
+        ws = FakeWorksheet([["", "http://img"]])
+        get_status = run_batch(ws, status=m.ThreadsAPIError(FakeResponse(401, "bad token")))
+        self.assertEqual(get_status.call_count, 1)
+        self.assertEqual(ws.cells["'Sheet1'!H2"], "failed")
+        self.assertIn("HTTP 401", ws.cells["'Sheet1'!J2"])
+
+    def test_server_error_while_polling_is_retried(self):
+        ws = FakeWorksheet([["", "http://img"]])
+        states = [m.ThreadsAPIError(FakeResponse(503)), {"status": "FINISHED"}]
+        with mock.patch.object(m, "publish_container", return_value={"id": "p1"}):
+            get_status = run_batch(ws, status=states)
+        self.assertEqual(get_status.call_count, 2)
+        self.assertEqual(ws.cells["'Sheet1'!H2"], "posted")
+
+    def test_images_are_published_in_sheet_order(self):
+        ws = FakeWorksheet([["", "img1"], ["", "img2"]])
+        polls = {"img1": 0}
+        def status(token, cid):
+            # img1 は2回目のポーリングで、img2 は最初から FINISHED
+            if cid == "img1":
+                polls["img1"] += 1
+                return {"status": "FINISHED" if polls["img1"] > 1 else "IN_PROGRESS"}
+            return {"status": "FINISHED"}
+        with mock.patch.object(m, "publish_container", return_value={"id": "p"}) as publish:
+            run_batch(ws, created=lambda u, t, payload: {"id": payload["image_url"]}, status=status)
+        self.assertEqual([c.args[2] for c in publish.call_args_list], ["img1", "img2"])
+        self.assertEqual(ws.cells["'Sheet1'!H2"], "posted")
+        self.assertEqual(ws.cells["'Sheet1'!H3"], "posted")
+
+if __name__ == "__main__":
+    unittest.main()